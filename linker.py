@@ -3,12 +3,68 @@ import sys
 import threading
 from tkinter import Tk, Label, Button, Checkbutton, IntVar, messagebox, PhotoImage
 from flask import Flask, request
+from flask.json.provider import DefaultJSONProvider
 import psutil
 import os
 import random
 import string
+import hmac
+import time
+import functools
+import signal
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def orjson_default(obj):
+    # psutil returns namedtuples, which the stdlib encoder writes as arrays
+    if isinstance(obj, tuple):
+        return list(obj)
+    raise TypeError
+
+def orjson_option(kwargs):
+    # orjson only has equivalents for these json.dumps arguments; refuse the
+    # rest rather than silently ignoring them
+    option = 0
+    if kwargs.pop('sort_keys', False):
+        option |= orjson.OPT_SORT_KEYS
+    # orjson output is always compact, which is what Flask's session serializer asks for
+    if tuple(kwargs.pop('separators', (',', ':'))) != (',', ':'):
+        raise TypeError("orjson only supports compact separators")
+    if kwargs:
+        raise TypeError(f"orjson does not support: {', '.join(sorted(kwargs))}")
+    return option
+
+class ORJSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=orjson_default, option=orjson_option(kwargs)).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            raise TypeError(f"orjson does not support: {', '.join(sorted(kwargs))}")
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if args and kwargs:
+            raise TypeError("app.json.response() takes either args or kwargs, not both")
+        if not args and not kwargs:
+            obj = None
+        elif len(args) == 1:
+            obj = args[0]
+        else:
+            obj = args or kwargs
+        return self._app.response_class(orjson.dumps(obj, default=orjson_default), mimetype=self.mimetype)
 
 app = Flask(__name__)
+if orjson is not None:
+    app.json = ORJSONProvider(app)
+
+RUN_TIMEOUT = 30
+RUN_KILL_TIMEOUT = 2
+DISK_USAGE_INTERVAL = 10
+STATS_IDLE_TIMEOUT = 30
 
 TOKEN_FILE = os.path.join(os.path.dirname(__file__), 'token.txt')
 
@@ -25,10 +81,56 @@ def load_token():
 def generate_token(length=16):
     return ''.join(random.choices(string.ascii_letters + string.digits, k=length))
 
-ROTUR_TOKEN = load_token() or generate_token()
-save_token(ROTUR_TOKEN)
+def check_token(token):
+    if not token:
+        return False
+    return hmac.compare_digest(token.encode('utf-8'), ROTUR_TOKEN.encode('utf-8'))
+
+def cache_result(timeout, maxsize=1024):
+    def decorator(func):
+        cache = {}
+        lock = threading.Lock()
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if args or kwargs:
+                key = (args, tuple(sorted(kwargs.items())))
+                try:
+                    hash(key)
+                except TypeError:
+                    return func(*args, **kwargs)
+            else:
+                key = ()
+            with lock:
+                entry = cache.get(key)
+                if entry is not None and time.monotonic() - entry[1] < timeout:
+                    return entry[0]
+                # recompute under the lock so a burst of misses shares one call
+                result = func(*args, **kwargs)
+                now = time.monotonic()
+                cache.pop(key, None)
+                if len(cache) >= maxsize:
+                    # expired entries go first, then the oldest live ones
+                    for stale_key in [k for k, (_, timestamp) in cache.items() if now - timestamp >= timeout]:
+                        del cache[stale_key]
+                    while len(cache) >= maxsize:
+                        del cache[next(iter(cache))]
+                cache[key] = (result, now)
+            return result
+        return wrapper
+    return decorator
+
+ROTUR_TOKEN = load_token()
+if not ROTUR_TOKEN:
+    ROTUR_TOKEN = generate_token()
+    save_token(ROTUR_TOKEN)
 
 request_count = 0
+request_count_changed = threading.Event()
+system_stats_body = None
+last_stats_request = float('-inf')
+stats_requested = threading.Event()
+run_slots = threading.BoundedSemaphore((os.cpu_count() or 1) * 2)
 
 deny_run = False
 deny_processes = False
@@ -39,65 +141,142 @@ deny_userinfo = False
 def before_request():
     global request_count
     request_count += 1
+    request_count_changed.set()
 
 @app.route('/link', methods=['GET'])
 def link():
-    if request.args.get('token') == ROTUR_TOKEN:
+    if check_token(request.args.get('token')):
         return "Link successful"
     else:
         return "Link failed"
 
+def encode_json(obj):
+    if orjson is not None:
+        return orjson.dumps(obj, default=orjson_default)
+    return app.json.dumps(obj).encode('utf-8')
+
+def json_response(body):
+    return app.response_class(body, mimetype='application/json')
+
+def collect_stats(interval, disk_usage=None):
+    cpu_usage = psutil.cpu_percent(interval=interval)
+    memory_info = psutil.virtual_memory()
+    if disk_usage is None:
+        disk_usage = psutil.disk_usage('/')
+    disk_io_counters = psutil.disk_io_counters()
+
+    return {
+        "cpu_usage": cpu_usage,
+        "memory_total": memory_info.total,
+        "memory_used": memory_info.used,
+        "memory_free": memory_info.free,
+        "disk_total": disk_usage.total,
+        "disk_used": disk_usage.used,
+        "disk_free": disk_usage.free,
+        "disk_percent": disk_usage.percent,
+        "disk_io_counters": disk_io_counters._asdict() if disk_io_counters else {}
+    }
+
+def update_stats():
+    global system_stats_body
+    disk_usage = None
+    disk_usage_time = 0
+    while True:
+        now = time.monotonic()
+        # nobody is polling /stats, so stop sampling until someone does
+        if now - last_stats_request > STATS_IDLE_TIMEOUT:
+            stats_requested.clear()
+            # re-check after clearing so a request that just arrived isn't missed
+            if time.monotonic() - last_stats_request > STATS_IDLE_TIMEOUT:
+                system_stats_body = None
+                stats_requested.wait()
+            continue
+        # free space moves slowly, so it is refreshed less often than cpu/memory
+        if disk_usage is None or now - disk_usage_time >= DISK_USAGE_INTERVAL:
+            disk_usage = psutil.disk_usage('/')
+            disk_usage_time = now
+        # cpu_percent blocks for the interval, which also paces the loop
+        system_stats_body = encode_json(collect_stats(interval=2, disk_usage=disk_usage))
+
 @app.route('/stats', methods=['GET'])
 def stat():
+    global last_stats_request, system_stats_body
     if deny_stat:
         return "Stat access denied"
-    if request.args.get('token') == ROTUR_TOKEN:
-        cpu_usage = psutil.cpu_percent(interval=1)
-        memory_info = psutil.virtual_memory()
-        disk_usage = psutil.disk_usage('/')
-
-        stats = {
-            "cpu_usage": cpu_usage,
-            "memory_total": memory_info.total,
-            "memory_used": memory_info.used,
-            "memory_free": memory_info.free,
-            "disk_total": disk_usage.total,
-            "disk_used": disk_usage.used,
-            "disk_free": disk_usage.free,
-            "disk_percent": disk_usage.percent,
-            "disk_io_counters": psutil.disk_io_counters()._asdict()
-        }
-
-        return stats
+    if check_token(request.args.get('token')):
+        last_stats_request = time.monotonic()
+        stats_requested.set()
+        # read once: the stats thread may clear the global between two reads
+        body = system_stats_body
+        if body is None:
+            # psutil tracks cpu_percent(interval=None) per thread, so a fresh
+            # request thread would read ~0; take a real sample instead
+            body = encode_json(collect_stats(interval=1))
+            system_stats_body = body
+        return json_response(body)
     else:
         return "Stat failed"
 
+@cache_result(timeout=1)
+def get_processes():
+    return encode_json([process.info for process in psutil.process_iter(['pid', 'name', 'username', 'cpu_percent', 'memory_percent'])])
+
 @app.route('/processes', methods=['GET'])
 def processes():
     if deny_processes:
         return "Processes access denied"
-    if request.args.get('token') == ROTUR_TOKEN:
-        processes = []
-        for process in psutil.process_iter():
-            processes.append(process.as_dict(attrs=['pid', 'name', 'username', 'cpu_percent', 'memory_percent']))
-
-        return processes
+    if check_token(request.args.get('token')):
+        return json_response(get_processes())
     else:
         return "Processes failed"
 
+def kill_process_tree(process):
+    if sys.platform == "win32":
+        subprocess.call(['taskkill', '/F', '/T', '/PID', str(process.pid)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    else:
+        # the shell leads its own session, so this also reaches its children
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
 @app.route('/run', methods=['GET'])
 def run():
     if deny_run:
         return "Run access denied"
-    if request.args.get('token') == ROTUR_TOKEN:
+    if check_token(request.args.get('token')):
         command = request.args.get('command')
         if command:
-            process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            stdout, stderr = process.communicate()
-            return {
-                "stdout": stdout.decode('utf-8'),
-                "stderr": stderr.decode('utf-8')
+            if not run_slots.acquire(blocking=False):
+                return "Run busy", 503, {"Retry-After": "1"}
+            timed_out = False
+            try:
+                process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=True)
+                try:
+                    stdout, stderr = process.communicate(timeout=RUN_TIMEOUT)
+                except subprocess.TimeoutExpired:
+                    timed_out = True
+                    kill_process_tree(process)
+                    try:
+                        stdout, stderr = process.communicate(timeout=RUN_KILL_TIMEOUT)
+                    except subprocess.TimeoutExpired as e:
+                        # a descendant left the process group and still holds the pipes
+                        stdout, stderr = e.stdout or b'', e.stderr or b''
+                        if sys.platform != "win32":
+                            process.stdout.close()
+                            process.stderr.close()
+                        # on Windows the daemon reader threads hold the pipe locks, so
+                        # closing would block too; they are left behind instead
+                        process.wait()
+            finally:
+                run_slots.release()
+            result = {
+                "stdout": stdout.decode('utf-8', 'replace'),
+                "stderr": stderr.decode('utf-8', 'replace')
             }
+            if timed_out:
+                result["error"] = f"Command timed out after {RUN_TIMEOUT} seconds"
+            return result
         else:
             return "No command provided"
     else:
@@ -107,7 +286,7 @@ def run():
 def userinfo():
     if deny_userinfo:
         return "User info access denied"
-    if request.args.get('token') == ROTUR_TOKEN:
+    if check_token(request.args.get('token')):
         return {
             "user": psutil.users()
         }
@@ -115,13 +294,18 @@ def userinfo():
         return "User info failed"
 
 def run_flask():
-    app.run(host='127.0.0.1', port=5001)
+    app.run(host='127.0.0.1', port=5001, threaded=True)
 
 def start_flask_thread():
     flask_thread = threading.Thread(target=run_flask)
     flask_thread.daemon = True
     flask_thread.start()
 
+def start_stats_thread():
+    stats_thread = threading.Thread(target=update_stats)
+    stats_thread.daemon = True
+    stats_thread.start()
+
 def add_to_startup():
     if sys.platform == "win32":
         startup_folder = os.path.join(os.getenv('APPDATA'), 'Microsoft', 'Windows', 'Start Menu', 'Programs', 'Startup')
@@ -214,8 +398,10 @@ def create_tkinter_app():
         deny_userinfo = userinfo_var.get() == 1
 
     def update_request_count_label():
-        request_count_label.config(text=f"Total Requests: {request_count}")
-        root.after(1000, update_request_count_label)
+        if request_count_changed.is_set():
+            request_count_changed.clear()
+            request_count_label.config(text=f"Total Requests: {request_count}")
+        root.after(500, update_request_count_label)
 
     def regenerate_token():
         global ROTUR_TOKEN
@@ -254,9 +440,10 @@ def create_tkinter_app():
     button = Button(root, text="Exit", command=root.quit)
     button.pack(pady=10, padx=10, anchor='w')
 
-    root.after(1000, update_request_count_label)
+    root.after(500, update_request_count_label)
     root.mainloop()
 
 if __name__ == '__main__':
+    start_stats_thread()
     start_flask_thread()
     create_tkinter_app()